@@ -1,23 +1,71 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional, NamedTuple
 from datetime import datetime, timedelta
 import jwt
+import orjson
+import hashlib
+from cachetools import TTLCache
 from passlib.context import CryptContext
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import make_url, event, select, insert, func, Index, Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
+from contextlib import asynccontextmanager
 import os
+import shutil
+import time
+import types
+import uuid
 
-# Initialize FastAPI app
-app = FastAPI(title="Fitness and Music App")
-
-# Database configuration - Using SQLite
+# Database configuration - SQLite by default, DATABASE_URL overrides for Postgres.
+# The URL must name an async driver, e.g. sqlite+aiosqlite:// or postgresql+asyncpg://
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'fitness_music.db')}"
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(BASE_DIR, 'fitness_music.db')}")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_MEMORY_SQLITE = IS_SQLITE and make_url(DATABASE_URL).database in (None, "", ":memory:")
+
+if IS_SQLITE:
+    connect_args = {"check_same_thread": False}
+else:
+    # JIT compilation costs more than it saves on the short queries this app issues
+    connect_args = {"server_settings": {"jit": "off"}}
+
+# In-memory SQLite lives on a single shared connection (StaticPool), which takes no sizing options
+if IS_MEMORY_SQLITE:
+    pool_args = {}
+else:
+    pool_args = {
+        "pool_size": 20,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "pool_recycle": 3600
+    }
+
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args=connect_args,
+    pool_pre_ping=True,
+    **pool_args
+)
+
+# WAL lets readers proceed while a write is in flight; in-memory databases can't use it
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not IS_MEMORY_SQLITE:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+
+# expire_on_commit=False so handlers can read attributes after commit without a lazy load
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Security configuration
@@ -25,9 +73,33 @@ SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# One decoder with fixed algorithms and options, instead of rebuilding them per request
+jwt_decoder = jwt.PyJWT()
+JWT_ALGORITHMS = (ALGORITHM,)
+JWT_DECODE_OPTIONS = {"require": ["exp", "sub"], "verify_exp": True}
+
+# Each bcrypt round doubles the hashing cost; 10 keeps login latency acceptable.
+# Existing hashes keep their own cost factor and still verify.
+BCRYPT_ROUNDS = 10
+
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS, deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Validated tokens map to their user so repeat calls skip the decode and the user lookup.
+# The cache is per process; multi-worker deployments would need a shared store such as Redis.
+TOKEN_CACHE_TTL_SECONDS = 60
+token_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+# Recently issued access tokens, keyed by a keyed hash of the submitted credentials, so
+# clients that log in before every call don't pay for a bcrypt verify each time
+login_cache = TTLCache(maxsize=1024, ttl=30)
+
+# Pre-serialized JSON bodies for read-mostly endpoints; writes to the underlying tables evict them
+# Keys are "<group>" or "<group>:<detail>". Each group has a generation that invalidation
+# bumps, so a read that started before a write can't put its stale result back in the cache.
+response_cache = TTLCache(maxsize=64, ttl=60)
+response_generations = {"categories": 0, "songs": 0}
+
 # Database models
 class User(Base):
     __tablename__ = "users"
@@ -45,6 +117,7 @@ class WorkoutCategory(Base):
 # Fitness Models
 class Workout(Base):
     __tablename__ = "workouts"
+    __table_args__ = (Index("ix_workouts_user_date", "user_id", "date"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     workout_type = Column(String)
@@ -56,7 +129,7 @@ class Workout(Base):
 class UserGoal(Base):
     __tablename__ = "user_goals"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     goal_type = Column(String(50))
     target_value = Column(Float)
     deadline = Column(DateTime)
@@ -70,7 +143,7 @@ class Song(Base):
     duration = Column(Float)
     file_path = Column(String)
     genre = Column(String)
-    bpm = Column(Integer, nullable=True)
+    bpm = Column(Integer, nullable=True, index=True)
 
 class Playlist(Base):
     __tablename__ = "playlists"
@@ -82,17 +155,40 @@ class Playlist(Base):
 
 class PlaylistSong(Base):
     __tablename__ = "playlist_songs"
+    __table_args__ = (Index("ix_playlist_songs_pl_pos", "playlist_id", "position"),)
     id = Column(Integer, primary_key=True, index=True)
     playlist_id = Column(Integer, ForeignKey("playlists.id"))
     song_id = Column(Integer, ForeignKey("songs.id"))
     position = Column(Integer)
 
 # Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    await engine.dispose()
+
+# Initialize FastAPI app
+app = FastAPI(title="Fitness and Music App", lifespan=lifespan)
 
 # Create uploads directory for songs
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads", "songs")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Upper bound on songs per bulk playlist append; each one becomes a row in a single INSERT
+MAX_BULK_PLAYLIST_SONGS = 500
+
+# Recommended BPM range per workout type; keys are already case-folded
+RECOMMENDED_BPM = types.MappingProxyType({
+    "running": (140, 160),
+    "walking": (120, 140),
+    "cycling": (130, 150),
+    "hiit": (150, 170),
+    "yoga": (60, 90),
+    "strength": (130, 150)
+})
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -128,6 +224,8 @@ class PlaylistCreate(BaseModel):
     is_workout_playlist: bool = False
 
 class WorkoutResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     workout_type: str
     duration: float
@@ -135,10 +233,9 @@ class WorkoutResponse(BaseModel):
     date: datetime
     music_playlist_id: Optional[int]
 
-    class Config:
-        orm_mode = True
-
 class SongResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     title: str
     artist: str
@@ -146,25 +243,18 @@ class SongResponse(BaseModel):
     genre: str
     bpm: Optional[int]
 
-    class Config:
-        orm_mode = True
-
 class PlaylistResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     name: str
     description: str
     is_workout_playlist: bool
 
-    class Config:
-        orm_mode = True
-
 # Helper functions
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -178,472 +268,469 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+class TokenUser(NamedTuple):
+    id: int
+    username: str
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> TokenUser:
+    key = hashlib.blake2b(token.encode()).digest()
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached
+
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials"
+    )
+    try:
+        payload = jwt_decoder.decode(token, SECRET_KEY, algorithms=JWT_ALGORITHMS, options=JWT_DECODE_OPTIONS)
+    except jwt.PyJWTError:
+        raise credentials_exception
+    username = payload.get("sub")
+    user = (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
+    if user is None:
+        raise credentials_exception
+
+    token_user = TokenUser(user.id, user.username)
+    # Tokens about to expire are not cached, so a cache hit never outlives the token
+    if payload["exp"] - time.time() > TOKEN_CACHE_TTL_SECONDS:
+        token_cache[key] = token_user
+    return token_user
+
+# Song metadata arrives as form fields alongside the uploaded file
+def song_form(
+    title: str = Form(...),
+    artist: str = Form(...),
+    duration: float = Form(...),
+    genre: str = Form(...),
+    bpm: Optional[int] = Form(None)
+) -> SongCreate:
+    return SongCreate(title=title, artist=artist, duration=duration, genre=genre, bpm=bpm)
+
+def save_upload(upload: UploadFile, destination: str):
+    # Copy in fixed-size chunks so memory use doesn't grow with the file
+    with open(destination, "wb") as out:
+        shutil.copyfileobj(upload.file, out, UPLOAD_CHUNK_SIZE)
+
+def cached_json(key: str) -> Optional[Response]:
+    body = response_cache.get(key)
+    if body is None:
+        return None
+    return Response(content=body, media_type="application/json")
+
+def store_json(key: str, group: str, generation: int, content) -> Response:
+    body = orjson.dumps(content)
+    if response_generations[group] == generation:
+        response_cache[key] = body
+    return Response(content=body, media_type="application/json")
+
+def invalidate_responses(group: str):
+    response_generations[group] += 1
+    for key in list(response_cache):
+        if key == group or key.startswith(f"{group}:"):
+            response_cache.pop(key, None)
+
+async def get_workout_totals(user_id: int, db: AsyncSession):
+    # Aggregate in SQL so only three scalars come back instead of every workout row
+    return (await db.execute(
+        select(
+            func.count(Workout.id),
+            func.coalesce(func.sum(Workout.duration), 0.0),
+            func.coalesce(func.sum(Workout.calories_burned), 0.0)
+        ).where(Workout.user_id == user_id)
+    )).one()
+
 # API endpoints
 @app.post("/users/", response_model=dict)
-async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    # bcrypt is CPU-bound, so hash off the event loop
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
     db_user = User(
         username=user.username,
         email=user.email,
-        hashed_password=get_password_hash(user.password)
+        hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    # The unique constraints on username and email do the existence check in the same round trip
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Username or email already registered")
     return {"message": "User created successfully"}
 
 @app.post("/token")
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    login_key = hashlib.blake2b(
+        f"{form_data.username}\0{form_data.password}".encode(),
+        key=SECRET_KEY.encode()
+    ).digest()
+    cached_token = login_cache.get(login_key)
+    if cached_token is not None:
+        return {"access_token": cached_token, "token_type": "bearer"}
+
+    user = (await db.execute(
+        select(User).where(User.username == form_data.username)
+    )).scalar_one_or_none()
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     access_token = create_access_token(data={"sub": user.username})
+    login_cache[login_key] = access_token
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Workout endpoints
 @app.post("/workouts/", response_model=dict)
-async def create_workout(workout: WorkoutCreate, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        db_workout = Workout(
-            user_id=user.id,
-            workout_type=workout.workout_type,
-            duration=workout.duration,
-            calories_burned=workout.calories_burned,
-            music_playlist_id=workout.playlist_id
-        )
-        db.add(db_workout)
-        db.commit()
-        db.refresh(db_workout)
-        return {"message": "Workout logged successfully"}
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+async def create_workout(workout: WorkoutCreate, current_user: TokenUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_workout = Workout(
+        user_id=current_user.id,
+        workout_type=workout.workout_type,
+        duration=workout.duration,
+        calories_burned=workout.calories_burned,
+        music_playlist_id=workout.playlist_id
+    )
+    db.add(db_workout)
+    await db.commit()
+    return {"message": "Workout logged successfully"}
 
 # Music endpoints
 @app.post("/songs/", response_model=dict)
 async def create_song(
-    song: SongCreate,
+    song: SongCreate = Depends(song_form),
     file: UploadFile = File(...),
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
+    filename = os.path.basename(file.filename or "")
+    if not filename:
+        raise HTTPException(status_code=400, detail="Uploaded file has no name")
+    # Prefix a random id so uploads sharing a name don't overwrite each other
+    stored_name = f"{uuid.uuid4().hex}_{filename}"
+    file_path = f"uploads/songs/{stored_name}"
+    destination = os.path.join(UPLOAD_DIR, stored_name)
+    await run_in_threadpool(save_upload, file, destination)
+    
+    db_song = Song(
+        title=song.title,
+        artist=song.artist,
+        duration=song.duration,
+        file_path=file_path,
+        genre=song.genre,
+        bpm=song.bpm
+    )
+    db.add(db_song)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        # Save file logic here
-        file_path = f"uploads/songs/{file.filename}"
-        
-        db_song = Song(
-            title=song.title,
-            artist=song.artist,
-            duration=song.duration,
-            file_path=file_path,
-            genre=song.genre,
-            bpm=song.bpm
-        )
-        db.add(db_song)
-        db.commit()
-        db.refresh(db_song)
-        return {"message": "Song added successfully"}
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        await db.commit()
+    except Exception:
+        # Don't leave an orphaned file behind when the row can't be stored
+        await run_in_threadpool(os.remove, destination)
+        raise
+    invalidate_responses("songs")
+    return {"message": "Song added successfully"}
 
 @app.post("/playlists/", response_model=dict)
 async def create_playlist(
     playlist: PlaylistCreate,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        db_playlist = Playlist(
-            user_id=user.id,
-            name=playlist.name,
-            description=playlist.description,
-            is_workout_playlist=playlist.is_workout_playlist
-        )
-        db.add(db_playlist)
-        db.commit()
-        db.refresh(db_playlist)
-        return {"message": "Playlist created successfully"}
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    db_playlist = Playlist(
+        user_id=current_user.id,
+        name=playlist.name,
+        description=playlist.description,
+        is_workout_playlist=playlist.is_workout_playlist
+    )
+    db.add(db_playlist)
+    await db.commit()
+    return {"message": "Playlist created successfully"}
 
 @app.post("/playlists/{playlist_id}/songs/{song_id}")
 async def add_song_to_playlist(
     playlist_id: int,
     song_id: int,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        # Get current highest position
-        max_position = db.query(PlaylistSong).filter(
-            PlaylistSong.playlist_id == playlist_id
-        ).count()
-        
-        playlist_song = PlaylistSong(
-            playlist_id=playlist_id,
-            song_id=song_id,
-            position=max_position + 1
+    # Next position is computed inside the INSERT, so concurrent adds can't reuse a slot
+    next_position = select(
+        func.coalesce(func.max(PlaylistSong.position), 0) + 1
+    ).where(PlaylistSong.playlist_id == playlist_id).scalar_subquery()
+    
+    await db.execute(insert(PlaylistSong).values(
+        playlist_id=playlist_id,
+        song_id=song_id,
+        position=next_position
+    ))
+    await db.commit()
+    return {"message": "Song added to playlist"}
+
+@app.post("/playlists/{playlist_id}/songs")
+async def add_songs_to_playlist(
+    playlist_id: int,
+    song_ids: List[int],
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if not song_ids:
+        return {"message": "No songs to add"}
+    if len(song_ids) > MAX_BULK_PLAYLIST_SONGS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_PLAYLIST_SONGS} songs can be added at once"
         )
-        db.add(playlist_song)
-        db.commit()
-        return {"message": "Song added to playlist"}
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    # The end of the playlist is read inside the INSERT itself, like the single-song endpoint,
+    # so concurrent appends can't be handed the same positions
+    max_position = select(
+        func.coalesce(func.max(PlaylistSong.position), 0)
+    ).where(PlaylistSong.playlist_id == playlist_id).scalar_subquery()
+    
+    await db.execute(insert(PlaylistSong).values([
+        {"playlist_id": playlist_id, "song_id": song_id, "position": max_position + offset}
+        for offset, song_id in enumerate(song_ids, start=1)
+    ]))
+    await db.commit()
+    return {"message": f"{len(song_ids)} songs added to playlist"}
 
 # Simple test endpoints to verify routing
 @app.get("/test")
 async def test_endpoint():
     return {"message": "Test endpoint working"}
 
+# Static /workouts/ paths must be registered before /workouts/{workout_id} to be reachable
+@app.get("/workouts/recommended_music")
+async def get_recommended_music(
+    workout_type: str,
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Simple recommendation logic based on workout type
+    workout_type = workout_type.casefold()
+    bpm_range = RECOMMENDED_BPM.get(workout_type)
+    if bpm_range is not None:
+        cache_key = f"songs:recommended:{workout_type}"
+        cached = cached_json(cache_key)
+        if cached is not None:
+            return cached
+        generation = response_generations["songs"]
+        min_bpm, max_bpm = bpm_range
+        songs = (await db.execute(select(Song).where(
+            Song.bpm >= min_bpm,
+            Song.bpm <= max_bpm
+        ))).scalars().all()
+        return store_json(cache_key, "songs", generation, jsonable_encoder({
+            "workout_type": workout_type,
+            "recommended_bpm_range": f"{min_bpm}-{max_bpm}",
+            "songs": songs
+        }))
+    else:
+        return {"message": "No specific recommendations for this workout type"}
+
 @app.get("/workouts/{workout_id}")
 async def get_workout(
     workout_id: int,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        workout = db.query(Workout).filter(
-            Workout.id == workout_id,
-            Workout.user_id == user.id
-        ).first()
+    workout = (await db.execute(select(Workout).where(
+        Workout.id == workout_id,
+        Workout.user_id == current_user.id
+    ))).scalar_one_or_none()
+    
+    if workout is None:
+        raise HTTPException(status_code=404, detail="Workout not found")
         
-        if workout is None:
-            raise HTTPException(status_code=404, detail="Workout not found")
-            
-        return workout
-    except jwt.JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials"
-        )
+    return workout
 
 @app.put("/workouts/{workout_id}")
 async def update_workout(
     workout_id: int,
     workout: WorkoutCreate,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        db_workout = db.query(Workout).filter(
-            Workout.id == workout_id,
-            Workout.user_id == user.id
-        ).first()
+    db_workout = (await db.execute(select(Workout).where(
+        Workout.id == workout_id,
+        Workout.user_id == current_user.id
+    ))).scalar_one_or_none()
+    
+    if db_workout is None:
+        raise HTTPException(status_code=404, detail="Workout not found")
         
-        if db_workout is None:
-            raise HTTPException(status_code=404, detail="Workout not found")
-            
-        db_workout.workout_type = workout.workout_type
-        db_workout.duration = workout.duration
-        db_workout.calories_burned = workout.calories_burned
-        
-        db.commit()
-        db.refresh(db_workout)
-        return db_workout
-    except jwt.JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials"
-        )
+    db_workout.workout_type = workout.workout_type
+    db_workout.duration = workout.duration
+    db_workout.calories_burned = workout.calories_burned
+    
+    await db.commit()
+    await db.refresh(db_workout)
+    return db_workout
 
 @app.delete("/workouts/{workout_id}")
 async def delete_workout(
     workout_id: int,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        workout = db.query(Workout).filter(
-            Workout.id == workout_id,
-            Workout.user_id == user.id
-        ).first()
+    workout = (await db.execute(select(Workout).where(
+        Workout.id == workout_id,
+        Workout.user_id == current_user.id
+    ))).scalar_one_or_none()
+    
+    if workout is None:
+        raise HTTPException(status_code=404, detail="Workout not found")
         
-        if workout is None:
-            raise HTTPException(status_code=404, detail="Workout not found")
-            
-        db.delete(workout)
-        db.commit()
-        return {"message": "Workout deleted successfully"}
-    except jwt.JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials"
-        )
+    await db.delete(workout)
+    await db.commit()
+    return {"message": "Workout deleted successfully"}
 
 # Add some statistics endpoints
 @app.get("/workouts/stats/total")
 async def get_workout_stats(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        workouts = db.query(Workout).filter(Workout.user_id == user.id).all()
-        
-        total_workouts = len(workouts)
-        total_duration = sum(w.duration for w in workouts)
-        total_calories = sum(w.calories_burned for w in workouts)
-        
-        return {
-            "total_workouts": total_workouts,
-            "total_duration_minutes": total_duration,
-            "total_calories_burned": total_calories
-        }
-    except jwt.JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials"
-        )
+    total_workouts, total_duration, total_calories = await get_workout_totals(current_user.id, db)
+    
+    return {
+        "total_workouts": total_workouts,
+        "total_duration_minutes": total_duration,
+        "total_calories_burned": total_calories
+    }
 
 @app.post("/categories/")
 async def create_category(
     category: CategoryCreate,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        db_category = WorkoutCategory(**category.dict())
-        db.add(db_category)
-        db.commit()
-        db.refresh(db_category)
-        return {"message": "Category created successfully"}
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    db_category = WorkoutCategory(**category.model_dump())
+    db.add(db_category)
+    await db.commit()
+    invalidate_responses("categories")
+    return {"message": "Category created successfully"}
 
 @app.get("/categories/")
 async def get_categories(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        categories = db.query(WorkoutCategory).all()
-        return categories
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    cached = cached_json("categories")
+    if cached is not None:
+        return cached
+    generation = response_generations["categories"]
+    categories = (await db.execute(select(WorkoutCategory))).scalars().all()
+    return store_json("categories", "categories", generation, jsonable_encoder(categories))
 
 @app.post("/goals/")
 async def create_goal(
     goal: GoalCreate,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        db_goal = UserGoal(
-            user_id=user.id,
-            goal_type=goal.goal_type,
-            target_value=goal.target_value,
-            deadline=goal.deadline
-        )
-        db.add(db_goal)
-        db.commit()
-        db.refresh(db_goal)
-        return {"message": "Goal created successfully"}
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    db_goal = UserGoal(
+        user_id=current_user.id,
+        goal_type=goal.goal_type,
+        target_value=goal.target_value,
+        deadline=goal.deadline
+    )
+    db.add(db_goal)
+    await db.commit()
+    return {"message": "Goal created successfully"}
 
 @app.get("/goals/")
 async def get_goals(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        goals = db.query(UserGoal).filter(UserGoal.user_id == user.id).all()
-        return goals
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    goals = (await db.execute(select(UserGoal).where(UserGoal.user_id == current_user.id))).scalars().all()
+    return goals
 
 @app.get("/goals/progress")
 async def get_goal_progress(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        goals = db.query(UserGoal).filter(UserGoal.user_id == user.id).all()
-        workouts = db.query(Workout).filter(Workout.user_id == user.id).all()
-        
-        progress = []
-        for goal in goals:
-            if goal.goal_type == "calories":
-                total_calories = sum(w.calories_burned for w in workouts)
-                progress.append({
-                    "goal_type": goal.goal_type,
-                    "target": goal.target_value,
-                    "current": total_calories,
-                    "percentage": (total_calories / goal.target_value) * 100 if goal.target_value > 0 else 0
-                })
-            elif goal.goal_type == "duration":
-                total_duration = sum(w.duration for w in workouts)
-                progress.append({
-                    "goal_type": goal.goal_type,
-                    "target": goal.target_value,
-                    "current": total_duration,
-                    "percentage": (total_duration / goal.target_value) * 100 if goal.target_value > 0 else 0
-                })
-        
-        return progress
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    goals = (await db.execute(select(UserGoal).where(UserGoal.user_id == current_user.id))).scalars().all()
+    _, total_duration, total_calories = await get_workout_totals(current_user.id, db)
+    
+    progress = []
+    for goal in goals:
+        if goal.goal_type == "calories":
+            progress.append({
+                "goal_type": goal.goal_type,
+                "target": goal.target_value,
+                "current": total_calories,
+                "percentage": (total_calories / goal.target_value) * 100 if goal.target_value > 0 else 0
+            })
+        elif goal.goal_type == "duration":
+            progress.append({
+                "goal_type": goal.goal_type,
+                "target": goal.target_value,
+                "current": total_duration,
+                "percentage": (total_duration / goal.target_value) * 100 if goal.target_value > 0 else 0
+            })
+    
+    return progress
 
 @app.get("/workouts/", response_model=List[WorkoutResponse])
 async def get_workouts(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        workouts = db.query(Workout).filter(Workout.user_id == user.id).all()
-        return workouts
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    workouts = (await db.execute(select(Workout).where(Workout.user_id == current_user.id))).scalars().all()
+    return workouts
 
 @app.get("/songs/", response_model=List[SongResponse])
 async def get_songs(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        songs = db.query(Song).all()
-        return songs
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    cached = cached_json("songs")
+    if cached is not None:
+        return cached
+    generation = response_generations["songs"]
+    songs = (await db.execute(select(Song))).scalars().all()
+    return store_json("songs", "songs", generation, [SongResponse.model_validate(song).model_dump(mode="json") for song in songs])
 
 @app.get("/playlists/", response_model=List[PlaylistResponse])
 async def get_playlists(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        playlists = db.query(Playlist).filter(Playlist.user_id == user.id).all()
-        return playlists
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    playlists = (await db.execute(select(Playlist).where(Playlist.user_id == current_user.id))).scalars().all()
+    return playlists
 
 @app.get("/playlists/{playlist_id}/songs", response_model=List[SongResponse])
 async def get_playlist_songs(
     playlist_id: int,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        songs = db.query(Song).join(PlaylistSong).filter(
-            PlaylistSong.playlist_id == playlist_id
-        ).order_by(PlaylistSong.position).all()
-        return songs
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-@app.get("/workouts/recommended_music")
-async def get_recommended_music(
-    workout_type: str,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        
-        # Simple recommendation logic based on workout type
-        recommended_bpm = {
-            "running": (140, 160),
-            "walking": (120, 140),
-            "cycling": (130, 150),
-            "hiit": (150, 170),
-            "yoga": (60, 90),
-            "strength": (130, 150)
-        }
-        
-        workout_type = workout_type.lower()
-        if workout_type in recommended_bpm:
-            min_bpm, max_bpm = recommended_bpm[workout_type]
-            songs = db.query(Song).filter(
-                Song.bpm >= min_bpm,
-                Song.bpm <= max_bpm
-            ).all()
-            return {
-                "workout_type": workout_type,
-                "recommended_bpm_range": f"{min_bpm}-{max_bpm}",
-                "songs": songs
-            }
-        else:
-            return {"message": "No specific recommendations for this workout type"}
-            
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    songs = (await db.execute(select(Song).join(PlaylistSong).where(
+        PlaylistSong.playlist_id == playlist_id
+    ).order_by(PlaylistSong.position))).scalars().all()
+    return songs
 
 @app.delete("/playlists/{playlist_id}/songs/{song_id}")
 async def remove_song_from_playlist(
     playlist_id: int,
     song_id: int,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    current_user: TokenUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        user = db.query(User).filter(User.username == username).first()
-        
-        playlist_song = db.query(PlaylistSong).filter(
-            PlaylistSong.playlist_id == playlist_id,
-            PlaylistSong.song_id == song_id
-        ).first()
-        
-        if playlist_song:
-            db.delete(playlist_song)
-            db.commit()
-            return {"message": "Song removed from playlist"}
-        else:
-            raise HTTPException(status_code=404, detail="Song not found in playlist")
-            
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token") 
+    playlist_song = (await db.execute(select(PlaylistSong).where(
+        PlaylistSong.playlist_id == playlist_id,
+        PlaylistSong.song_id == song_id
+    ))).scalars().first()
+    
+    if playlist_song:
+        await db.delete(playlist_song)
+        await db.commit()
+        return {"message": "Song removed from playlist"}
+    else:
+        raise HTTPException(status_code=404, detail="Song not found in playlist")
 
 if __name__ == "__main__":
     import uvicorn